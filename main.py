@@ -1,15 +1,19 @@
-from src.kvstore import KVStore
+import argparse
+import sys
+from typing import Iterable, List, Optional
 
+from src.kvstore import MAX_SPLIT, KVStore
+from src.wal import WalWriter
 
-def main():
-    store = KVStore()
+
+def run_interactive(store: KVStore) -> None:
+    """Интерактивный режим: читает команды через input() с приглашением."""
     print("Enter commands. Press Ctrl+D (Unix) or Ctrl+Z (Windows) to exit.")
     while True:
         try:
-            line = input("> ").strip()
-            if not line:
+            parts = input("> ").split(None, MAX_SPLIT)
+            if not parts:
                 continue
-            parts = line.split()
             store.process_command(parts)
         except EOFError:
             print("\nExiting.")
@@ -19,5 +23,26 @@ def main():
             break
 
 
+def run_script(store: KVStore, lines: Iterable[str]) -> None:
+    """Пакетный режим: выполняет команды из потока без приглашения и вызовов input()."""
+    store.process_batch(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="In-memory key-value store with transactions.")
+    parser.add_argument("--wal", metavar="PATH", help="файл журнала упреждающей записи для сохранения данных")
+    args = parser.parse_args(argv)
+
+    store = KVStore(WalWriter(args.wal) if args.wal else None)
+    try:
+        if sys.stdin.isatty():
+            run_interactive(store)
+        else:
+            run_script(store, sys.stdin)
+    finally:
+        # Сбрасываем журнал на диск при выходе по EOF/Ctrl+C (END закрывает его сам)
+        store.close()
+
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -1,68 +1,148 @@
 import sys
-from collections import defaultdict
-from typing import Dict, List, Optional, Set, Tuple
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 
 from src.logs import TransactionLogger
+from src.wal import WalWriter
+
+# Команды принимают не больше двух аргументов; лишний четвертый токен нужен
+# только для того, чтобы обработчик распознал неверное число аргументов
+MAX_SPLIT = 3
 
 
 class KVStore:
-    def __init__(self):
+    # Фиксированный набор атрибутов: экземпляр обходится без __dict__
+    __slots__ = ('_data', '_val_keys', '_tx_stack', '_tx_depth', '_wal')
+
+    # Настройки журнала транзакций: включен ли он и сколько последних записей хранить.
+    # При выключенном журнале записи не формируются вовсе - флаг проверяется перед log()
+    LOG_ENABLED = True
+    LOG_CAP = 1024
+
+    def __init__(self, wal: Optional[WalWriter] = None):
         """
         Инициализация key-value хранилища.
+        Аргументы:
+            wal: журнал упреждающей записи; если задан, хранилище восстанавливается из него
+                 и дописывает в него зафиксированные изменения
         """
         # Основное хранилище данных: ключ -> значение
         self._data: Dict[str, str] = {}
 
-        # Обратный индекс: значение -> множество ключей с этим значением
-        # Используем defaultdict для автоматического создания новых множеств
-        self._val_keys: Dict[str, Set[str]] = defaultdict(set)
-
-        # Стек для хранения снимков состояния при начале транзакций:
-        # Каждый элемент - кортеж из (снимок данных, снимок обратного индекса, логгер)
-        self._tx_stack: List[Tuple[Dict[str, str], Dict[str, Set[str]], TransactionLogger]] = []
-
-        # Текущий активный логгер транзакций (None, если нет активной транзакции)
-        self._current_logger: Optional[TransactionLogger] = None
+        # Обратный индекс: значение -> ключи с этим значением.
+        # Ключи хранятся как словарь-множество (ключ -> None): компактный массив словаря
+        # быстрее обходится при сортировке в find(), чем разреженная таблица множества.
+        # Вложенные словари создаются явно в _index_add, промахи при чтении ничего не создают
+        self._val_keys: Dict[str, Dict[str, None]] = {}
+
+        # Стек активных транзакций:
+        # Каждый элемент - кортеж из (журнал отмены, логгер).
+        # Журнал отмены: ключ -> значение до начала транзакции (None, если ключа не было).
+        # Для каждого ключа запоминается только первое изменение, поэтому откат стоит O(затронутых ключей)
+        self._tx_stack: List[Tuple[Dict[str, Optional[str]], TransactionLogger]] = []
+
+        # Глубина вложенности транзакций (0 - нет активной транзакции).
+        # Проверка целого числа на горячем пути дешевле обращения к логгеру;
+        # сам логгер берется из вершины стека только при записи
+        self._tx_depth = 0
+
+        # Восстанавливаем зафиксированное состояние из журнала, затем подключаем его для записи
+        self._wal: Optional[WalWriter] = None
+        if wal is not None:
+            for record in wal.replay():
+                # Строки из JSON интернируем так же, как в set()
+                key = sys.intern(record[1])
+                prev = sys.intern(record[2]) if record[0] == "SET" else None
+                self._apply_raw(key, prev)
+            self._wal = wal
+
+    def close(self) -> None:
+        """
+        Сбрасывает на диск и закрывает журнал упреждающей записи, если он подключен.
+        Незафиксированные транзакции в журнал не попадают.
+        """
+        if self._wal is not None:
+            self._wal.close()
+            self._wal = None
 
     def __repr__(self) -> str:
         """
         Строковое представление объекта для отладки.
         Возвращает текущее состояние данных и обратного индекса.
         """
-        return f"KVStore(data={self._data}, val_keys={dict(self._val_keys)})"
+        return f"KVStore(data={self._data}, val_keys={self._val_keys})"
 
-    def _snapshot(self) -> Tuple[Dict[str, str], Dict[str, Set[str]]]:
+    def _index_add(self, key: str, value: str) -> None:
         """
-        Создает глубокую копию текущего состояния хранилища.
-        Возвращает:
-            Кортеж из (копия _data, копия _val_keys)
+        Добавляет ключ в обратный индекс.
+        """
+        keys = self._val_keys.get(value)
+        if keys is None:
+            self._val_keys[value] = {key: None}
+        else:
+            keys[key] = None
+
+    def _index_remove(self, key: str, value: str) -> None:
+        """
+        Удаляет ключ из обратного индекса.
+        Если больше нет ключей с этим значением, удаляет запись.
         """
-        # Копируем основной словарь и создаем новый defaultdict с копиями множеств
-        return (
-            self._data.copy(),
-            defaultdict(set, {k: v.copy() for k, v in self._val_keys.items()})
-        )
+        val_keys = self._val_keys
+        keys = val_keys[value]
+        del keys[key]
+        if not keys:
+            del val_keys[value]
 
-    def _restore(self, snapshot: Tuple[Dict[str, str], Dict[str, Set[str]]]) -> None:
+    def _record_undo(self, key: str, prev: Optional[str]) -> None:
         """
-        Восстанавливает состояние хранилища из объекта _snapshot.
+        Запоминает в журнале отмены текущей транзакции предыдущее значение ключа.
+        Вызывается перед изменением ключа внутри транзакции.
+        Повторные изменения того же ключа не записываются: важно только исходное значение.
+        """
+        self._tx_stack[-1][0].setdefault(key, prev)
+
+    def _apply_raw(self, key: str, prev: Optional[str]) -> None:
+        """
+        Восстанавливает значение ключа из журнала отмены без логирования.
         Аргументы:
-            snapshot: кортеж объектов _snapshot данных и обратного индекса
+            key: ключ
+            prev: предыдущее значение или None, если ключа не было
+        """
+        data = self._data
+
+        # Убираем текущее значение ключа из обратного индекса
+        old_val = data.pop(key, None)
+        if old_val is not None:
+            self._index_remove(key, old_val)
+
+        # Возвращаем предыдущее значение, если оно было
+        if prev is not None:
+            data[key] = prev
+            self._index_add(key, prev)
+
+    @staticmethod
+    def _format_log(logger: TransactionLogger) -> str:
+        """
+        Формирует текст журнала транзакции для вывода.
+        Если часть записей вытеснена, указывает их количество.
         """
-        self._data, self._val_keys = snapshot
+        changes = repr(logger.get_changes())
+        dropped = logger.dropped()
+        if dropped:
+            return f"{changes} ({dropped} earlier entries omitted)"
+        return changes
 
     def begin(self) -> None:
         """
         Начинает новую транзакцию.
         - Создает новый логгер
-        - Сохраняет снимок текущего состояния
-        - Помещает снимок и логгер в стек транзакций
-        - Устанавливает текущий логгер
+        - Помещает пустой журнал отмены и логгер в стек транзакций
+        - Увеличивает глубину вложенности транзакций
         """
-        logger = TransactionLogger()  # Создаем новый логгер
-        self._tx_stack.append((self._snapshot(), logger))  # Сохраняем объект состояния
-        self._current_logger = logger  # Устанавливаем текущий логгер
-        logger.log("BEGIN")  # Логируем начало транзакции
+        logger = TransactionLogger(self.LOG_CAP)  # Создаем новый логгер
+        self._tx_stack.append(({}, logger))  # Пустой журнал отмены
+        self._tx_depth += 1
+        if self.LOG_ENABLED:
+            logger.log(("BEGIN",))  # Логируем начало транзакции
 
     def rollback(self) -> bool:
         """
@@ -75,17 +155,18 @@ class KVStore:
             print("NO TRANSACTION")  # Нет активных транзакций
             return False
 
-        # Извлекаем последний объект состояния и логгер из стека
-        snapshot, logger = self._tx_stack.pop()
+        # Извлекаем журнал отмены и логгер из стека
+        undo, logger = self._tx_stack.pop()
 
-        # Восстанавливаем состояние из последнего объекта состояния
-        self._restore(snapshot)
+        # Возвращаем каждому затронутому ключу исходное значение
+        for key, prev in undo.items():
+            self._apply_raw(key, prev)
 
         # Выводим информацию об откате
-        print(f"ROLLBACK: Changes reverted. Log: {logger.get_changes()}")
+        sys.stdout.write("ROLLBACK: Changes reverted. Log: " + self._format_log(logger) + "\n")
 
-        # Обновляем текущий логгер (берем из предыдущей транзакции, если есть)
-        self._current_logger = self._tx_stack[-1][1] if self._tx_stack else None
+        # Возвращаемся к предыдущей транзакции, если она есть
+        self._tx_depth -= 1
 
         return True
 
@@ -100,14 +181,28 @@ class KVStore:
             print("NO TRANSACTION")  # Нет активных транзакций
             return False
 
-        # Извлекаем логгер из стека (данные не нужны, так как изменения сохраняются)
-        _, logger = self._tx_stack.pop()
+        # Извлекаем журнал отмены и логгер из стека
+        undo, logger = self._tx_stack.pop()
+
+        # Во вложенной транзакции передаем журнал отмены родительской,
+        # чтобы ее откат отменил и зафиксированные изменения
+        # (ключи, уже записанные в родительском журнале, сохраняют более раннее значение)
+        if self._tx_stack:
+            parent_undo = self._tx_stack[-1][0]
+            for key, prev in undo.items():
+                parent_undo.setdefault(key, prev)
+        elif self._wal is not None:
+            # Внешняя транзакция: записываем итоговые значения затронутых ключей одним блоком
+            data = self._data
+            self._wal.commit(
+                ("SET", key, data[key]) if key in data else ("UNSET", key) for key in undo
+            )
 
         # Выводим информацию о коммите
-        print(f"COMMIT: Changes applied. Log: {logger.get_changes()}")
+        sys.stdout.write("COMMIT: Changes applied. Log: " + self._format_log(logger) + "\n")
 
-        # Обновляем текущий логгер
-        self._current_logger = self._tx_stack[-1][1] if self._tx_stack else None
+        # Возвращаемся к предыдущей транзакции, если она есть
+        self._tx_depth -= 1
 
         return True
 
@@ -117,41 +212,60 @@ class KVStore:
         Если ключ уже существует, обновляет его значение и обратный индекс.
         Логирует операцию, если выполняется внутри транзакции.
         """
+        # Интернируем только при записи: повторяющиеся ключи и значения хранятся в одном экземпляре.
+        # Аргументы чтения не интернируются, чтобы не добавлять лишний поиск и не засорять таблицу интернирования
+        key = sys.intern(key)
+        value = sys.intern(value)
+
+        data = self._data
+        # Значения хранилища - всегда строки, поэтому None однозначно означает отсутствие ключа
+        old_val = data.get(key)
+
+        # Запоминаем предыдущее значение для отката
+        if self._tx_depth:
+            self._record_undo(key, old_val)
+
         # Если ключ уже существует
-        if key in self._data:
-            old_val = self._data[key]
+        if old_val is not None:
             # Удаляем ключ из старого значения в обратном индексе
-            self._val_keys[old_val].discard(key)
-            # Если больше нет ключей с этим значением, удаляем запись
-            if not self._val_keys[old_val]:
-                del self._val_keys[old_val]
+            self._index_remove(key, old_val)
 
         # Устанавливаем новое значение
-        self._data[key] = value
+        data[key] = value
         # Добавляем ключ в обратный индекс для нового значения
-        self._val_keys[value].add(key)
+        self._index_add(key, value)
 
-        # Логируем операцию, если есть активная транзакция
-        if self._current_logger:
-            self._current_logger.log(f"SET {key} {value}")
+        # Логируем операцию, если есть активная транзакция и журнал включен;
+        # вне транзакции изменение сразу уходит в WAL
+        if self._tx_depth:
+            if self.LOG_ENABLED:
+                self._tx_stack[-1][1].log(("SET", key, value))
+        elif self._wal is not None:
+            self._wal.append(("SET", key, value))
 
     def unset(self, key: str) -> None:
         """
         Удаляет ключ из хранилища.
         Логирует операцию, если выполняется внутри транзакции.
         """
-        if key in self._data:
-            # Удаляем ключ и получаем его значение
-            old_val = self._data.pop(key)
-            # Удаляем ключ из обратного индекса
-            self._val_keys[old_val].discard(key)
-            # Если больше нет ключей с этим значением, удаляем запись
-            if not self._val_keys[old_val]:
-                del self._val_keys[old_val]
+        # Удаляем ключ и получаем его значение одним обращением к словарю
+        old_val = self._data.pop(key, None)
+        if old_val is None:
+            return
 
-            # Логируем операцию, если есть активная транзакция
-            if self._current_logger:
-                self._current_logger.log(f"UNSET {key}")
+        # Запоминаем предыдущее значение для отката
+        if self._tx_depth:
+            self._record_undo(key, old_val)
+
+        # Удаляем ключ из обратного индекса
+        self._index_remove(key, old_val)
+
+        # Логируем операцию, если есть активная транзакция и журнал включен
+        if self._tx_depth:
+            if self.LOG_ENABLED:
+                self._tx_stack[-1][1].log(("UNSET", key))
+        elif self._wal is not None:
+            self._wal.append(("UNSET", key))
 
     def get(self, key: str) -> str:
         """
@@ -165,14 +279,15 @@ class KVStore:
         Возвращает количество ключей с указанным значением.
         Использует обратный индекс для быстрого поиска.
         """
-        return len(self._val_keys.get(value, set()))
+        return len(self._val_keys.get(value, ()))
 
     def find(self, value: str) -> List[str]:
         """
         Возвращает отсортированный список ключей с указанным значением.
+        Сортировка выполняется при запросе, чтобы запись оставалась O(1).
         Если ключей нет, возвращает пустой список.
         """
-        keys = self._val_keys.get(value, set())
+        keys = self._val_keys.get(value)
         return sorted(keys) if keys else []
 
     def process_command(self, parts: List[str]) -> None:
@@ -184,48 +299,117 @@ class KVStore:
         if not parts:  # Пустая команда
             return
 
-        # Приводим команду к верхнему регистру
-        cmd = parts[0].upper()
-
-        # Словарь соответствия команд методам
-        command_map = {
-            'SET': lambda: self._handle_set(parts),
-            'GET': lambda: print(self.get(parts[1])),
-            'UNSET': lambda: self.unset(parts[1]),
-            'COUNTS': lambda: print(self.counts(parts[1])),
-            'FIND': lambda: self._handle_find(parts),
-            'BEGIN': lambda: self.begin(),
-            'ROLLBACK': lambda: self.rollback(),
-            'COMMIT': lambda: self.commit(),
-            'END': lambda: sys.exit(0)  # Завершение программы
-        }
-
-        try:
-            if cmd in command_map:
-                command_map[cmd]()  # Вызываем соответствующий метод
+        # Ищем обработчик в таблице команд, построенной один раз на уровне класса.
+        # Команды обычно приходят в верхнем регистре, поэтому upper() вызываем только при промахе
+        cmd = parts[0]
+        handler = self._DISPATCH.get(cmd)
+        if handler is None:
+            handler = self._DISPATCH.get(cmd.upper())
+
+        # Аргументы проверяются внутри обработчиков, поэтому исключения не перехватываем
+        if handler is not None:
+            handler(self, parts)  # Вызываем соответствующий обработчик
+        else:
+            print(f"INVALID COMMAND: {' '.join(parts)}")
+
+    def process_batch(self, lines: Iterable[str]) -> None:
+        """
+        Выполняет команды из набора строк (например, из перенаправленного stdin).
+        Таблица команд и разбиение строки привязаны к локальным переменным,
+        поэтому на каждую команду приходится один поиск в словаре и один вызов.
+        Аргументы:
+            lines: строки с командами; пустые строки пропускаются
+        """
+        dispatch_get = self._DISPATCH.get
+        for line in lines:
+            parts = line.split(None, MAX_SPLIT)
+            if not parts:
+                continue
+            handler = dispatch_get(parts[0])
+            if handler is not None:
+                handler(self, parts)
             else:
-                print(f"INVALID COMMAND: {' '.join(parts)}")
-        except (IndexError, Exception) as e:
-            print(f"ERROR: {str(e)}")  # Обработка ошибок выполнения
+                # Команда не в верхнем регистре или неизвестна - общий путь
+                self.process_command(parts)
 
     def _handle_set(self, parts: List[str]) -> None:
         """
         Обработчик команды SET.
         Проверяет корректность аргументов перед вызовом set().
         """
-        if len(parts) == 3:  # SET key value
-            self.set(parts[1], parts[2])
-        else:
+        if len(parts) != 3:  # SET key value
             print("INVALID SET COMMAND")  # Неправильное количество аргументов
+            return
+        self.set(parts[1], parts[2])
+
+    def _handle_get(self, parts: List[str]) -> None:
+        """
+        Обработчик команды GET.
+        Проверяет корректность аргументов перед вызовом get().
+        """
+        if len(parts) != 2:  # GET key
+            print("INVALID GET COMMAND")  # Неправильное количество аргументов
+            return
+        print(self.get(parts[1]))
+
+    def _handle_unset(self, parts: List[str]) -> None:
+        """
+        Обработчик команды UNSET.
+        Проверяет корректность аргументов перед вызовом unset().
+        """
+        if len(parts) != 2:  # UNSET key
+            print("INVALID UNSET COMMAND")  # Неправильное количество аргументов
+            return
+        self.unset(parts[1])
+
+    def _handle_counts(self, parts: List[str]) -> None:
+        """
+        Обработчик команды COUNTS.
+        Проверяет корректность аргументов перед вызовом counts().
+        """
+        if len(parts) != 2:  # COUNTS value
+            print("INVALID COUNTS COMMAND")  # Неправильное количество аргументов
+            return
+        print(self.counts(parts[1]))
 
     def _handle_find(self, parts: List[str]) -> None:
         """
         Обработчик команды FIND.
         Проверяет корректность аргументов перед вызовом find().
         """
-        if len(parts) == 2:  # FIND value
-            keys = self.find(parts[1])
-            # Выводим ключи через пробел или "NONE", если ключей нет
-            print(' '.join(keys) if keys else "NONE")
-        else:
-            print("INVALID FIND COMMAND")  # Неправильное количество аргументов
\ No newline at end of file
+        if len(parts) != 2:  # FIND value
+            print("INVALID FIND COMMAND")  # Неправильное количество аргументов
+            return
+        keys = self.find(parts[1])
+        # Выводим ключи через пробел или "NONE", если ключей нет
+        print(' '.join(keys) if keys else "NONE")
+
+    def _handle_begin(self, parts: List[str]) -> None:
+        """Обработчик команды BEGIN."""
+        self.begin()
+
+    def _handle_rollback(self, parts: List[str]) -> None:
+        """Обработчик команды ROLLBACK."""
+        self.rollback()
+
+    def _handle_commit(self, parts: List[str]) -> None:
+        """Обработчик команды COMMIT."""
+        self.commit()
+
+    def _handle_end(self, parts: List[str]) -> None:
+        """Обработчик команды END - завершение программы."""
+        self.close()
+        sys.exit(0)
+
+    # Таблица соответствия команд обработчикам (строится один раз при создании класса)
+    _DISPATCH: Dict[str, Callable[["KVStore", List[str]], None]] = {
+        'SET': _handle_set,
+        'GET': _handle_get,
+        'UNSET': _handle_unset,
+        'COUNTS': _handle_counts,
+        'FIND': _handle_find,
+        'BEGIN': _handle_begin,
+        'ROLLBACK': _handle_rollback,
+        'COMMIT': _handle_commit,
+        'END': _handle_end,
+    }
@@ -1,16 +1,33 @@
-from typing import List
+from collections import deque
+from typing import Deque, List, Tuple
 
 
 class TransactionLogger:
     """Логирует изменения внутри транзакции."""
-    def __init__(self):
-        self.changes: List[str] = []
+    __slots__ = ('changes', 'total')
 
-    def log(self, message: str):
-        self.changes.append(message)
+    def __init__(self, cap: int = 1024) -> None:
+        """
+        Аргументы:
+            cap: максимальное число хранимых записей; более старые вытесняются
+        """
+        # Записи хранятся кортежами, например ('SET', key, value);
+        # строки формируются только при запросе get_changes()
+        self.changes: Deque[Tuple[str, ...]] = deque(maxlen=cap)
+        # Общее число залогированных записей, включая вытесненные
+        self.total = 0
+
+    def log(self, entry: Tuple[str, ...]) -> None:
+        self.total += 1
+        self.changes.append(entry)
 
     def get_changes(self) -> List[str]:
-        return self.changes.copy()
+        return [' '.join(entry) for entry in self.changes]
+
+    def dropped(self) -> int:
+        """Количество записей, вытесненных из журнала из-за ограничения размера."""
+        return self.total - len(self.changes)
 
-    def clear(self):
-        self.changes.clear()
\ No newline at end of file
+    def clear(self) -> None:
+        self.changes.clear()
+        self.total = 0
\ No newline at end of file
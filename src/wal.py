@@ -0,0 +1,121 @@
+import json
+import os
+from typing import Iterable, Iterator, List, Tuple
+
+# Допустимые операции журнала и число элементов в записи каждой из них
+_ARITY = {"SET": 3, "UNSET": 2, "BEGIN": 1, "COMMIT": 1}
+
+
+class WalWriter:
+    """
+    Журнал упреждающей записи (WAL) для хранилища.
+    Каждая запись - одна строка JSON вида ["SET", key, value] или ["UNSET", key].
+    Изменения транзакции обрамляются маркерами BEGIN/COMMIT и записываются целиком при коммите.
+    """
+    __slots__ = ('path', '_file', '_batch_size', '_pending', '_recovered')
+
+    def __init__(self, path: str, batch_size: int = 64) -> None:
+        """
+        Читает уже существующий журнал и обрезает его хвост после последней целой записи,
+        чтобы новые записи не склеивались с оборванной строкой или незавершенной транзакцией.
+        Аргументы:
+            path: путь к файлу журнала (создается, если не существует)
+            batch_size: сколько записей вне транзакций накапливать перед fsync (групповой коммит)
+        """
+        self.path = path
+        self._batch_size = batch_size
+        self._pending = 0
+
+        self._recovered: List[Tuple[str, ...]] = []
+        if os.path.exists(path):
+            self._recovered, end = self._read(path)
+            if os.path.getsize(path) > end:
+                os.truncate(path, end)
+
+        self._file = open(path, 'a', encoding='utf-8')
+
+    @staticmethod
+    def _read(path: str) -> Tuple[List[Tuple[str, ...]], int]:
+        """
+        Разбирает журнал.
+        Возвращает:
+            Кортеж из (зафиксированные записи по порядку,
+            смещение в байтах за последней записью вне транзакции или маркером COMMIT)
+        """
+        records: List[Tuple[str, ...]] = []
+        tx: List[Tuple[str, ...]] = []
+        in_tx = False
+        offset = end = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                # Строка без перевода строки, с некорректным JSON или записью неверной формы
+                # считается оборванной записью после сбоя
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    decoded = json.loads(line)
+                except ValueError:
+                    break
+                if not (
+                    isinstance(decoded, list)
+                    and all(isinstance(item, str) for item in decoded)
+                    and _ARITY.get(decoded[0] if decoded else "") == len(decoded)
+                ):
+                    break
+                record = tuple(decoded)
+                offset += len(line)
+                op = record[0]
+                if op == "BEGIN":
+                    tx, in_tx = [], True
+                elif op == "COMMIT":
+                    records.extend(tx)
+                    tx, in_tx = [], False
+                    end = offset
+                elif in_tx:
+                    tx.append(record)
+                else:
+                    records.append(record)
+                    end = offset
+        return records, end
+
+    def replay(self) -> Iterator[Tuple[str, ...]]:
+        """
+        Возвращает зафиксированные записи, прочитанные при открытии журнала, по порядку.
+        Записи незавершенной транзакции (BEGIN без COMMIT) пропускаются.
+        """
+        records, self._recovered = self._recovered, []
+        return iter(records)
+
+    def append(self, record: Tuple[str, ...]) -> None:
+        """
+        Дописывает изменение, сделанное вне транзакции.
+        fsync выполняется раз в batch_size записей.
+        """
+        self._write(record)
+        self._pending += 1
+        if self._pending >= self._batch_size:
+            self.flush()
+
+    def commit(self, records: Iterable[Tuple[str, ...]]) -> None:
+        """
+        Записывает изменения транзакции между маркерами BEGIN и COMMIT и сразу выполняет fsync.
+        """
+        self._write(("BEGIN",))
+        for record in records:
+            self._write(record)
+        self._write(("COMMIT",))
+        self.flush()
+
+    def flush(self) -> None:
+        """Сбрасывает буфер и синхронизирует файл с диском."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+
+    def close(self) -> None:
+        """Сбрасывает накопленные записи на диск и закрывает файл."""
+        self.flush()
+        self._file.close()
+
+    def _write(self, record: Tuple[str, ...]) -> None:
+        self._file.write(json.dumps(record) + '\n')
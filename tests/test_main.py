@@ -1,6 +1,12 @@
+import io
+import random
+import sys
+
 import pytest
 
+from main import run_script
 from src.kvstore import KVStore
+from src.wal import WalWriter
 
 
 @pytest.fixture
@@ -86,3 +92,207 @@ def test_nested_transactions_commit(store):
     assert store.get("a") == "baz"
     store.rollback()  # Откатить внешнюю
     assert store.get("a") == "foo"
+
+def test_rollback_restores_index(store):
+    store.set("a", "foo")
+    store.set("b", "foo")
+    store.begin()
+    store.set("a", "bar")
+    store.unset("b")
+    store.set("c", "foo")
+    store.rollback()
+    assert store.get("c") == "NULL"
+    assert store.find("foo") == ["a", "b"]
+    assert store.counts("bar") == 0
+
+def test_nested_commit_then_outer_rollback_restores_unset(store):
+    store.set("a", "foo")
+    store.begin()
+    store.begin()
+    store.unset("a")
+    store.commit()
+    assert store.get("a") == "NULL"
+    store.rollback()
+    assert store.get("a") == "foo"
+    assert store.find("foo") == ["a"]
+
+def test_process_command(store, capsys):
+    store.process_command(["set", "a", "foo"])
+    store.process_command(["GET", "a"])
+    store.process_command(["COUNTS", "foo"])
+    store.process_command(["FIND", "foo"])
+    store.process_command(["FOO"])
+    captured = capsys.readouterr()
+    assert captured.out.splitlines() == ["foo", "1", "a", "INVALID COMMAND: FOO"]
+
+def test_process_command_end(store):
+    with pytest.raises(SystemExit):
+        store.process_command(["END"])
+
+@pytest.mark.parametrize("parts, message", [
+    (["SET", "a"], "INVALID SET COMMAND"),
+    (["GET"], "INVALID GET COMMAND"),
+    (["UNSET"], "INVALID UNSET COMMAND"),
+    (["COUNTS"], "INVALID COUNTS COMMAND"),
+    (["FIND", "a", "b"], "INVALID FIND COMMAND"),
+])
+def test_process_command_invalid_arguments(store, capsys, parts, message):
+    store.process_command(parts)
+    captured = capsys.readouterr()
+    assert captured.out.strip() == message
+
+def test_set_interns_strings(store):
+    key = "".join(["k", "ey"])
+    value = "".join(["va", "lue"])
+    store.set(key, value)
+    stored_key, stored_value = next(iter(store._data.items()))
+    assert stored_key is sys.intern("key")
+    assert stored_value is sys.intern("value")
+
+def test_commit_prints_log(store, capsys):
+    store.begin()
+    store.set("a", "foo")
+    store.unset("a")
+    store.commit()
+    captured = capsys.readouterr()
+    assert captured.out.strip() == "COMMIT: Changes applied. Log: ['BEGIN', 'SET a foo', 'UNSET a']"
+
+def test_find_is_sorted(store):
+    for key in ("d", "b", "c", "a"):
+        store.set(key, "foo")
+    store.unset("c")
+    store.set("b", "bar")
+    assert store.find("foo") == ["a", "d"]
+    assert store.find("bar") == ["b"]
+    assert store.counts("foo") == 2
+    assert store.counts("bar") == 1
+
+def test_run_script(store, capsys):
+    run_script(store, io.StringIO("SET a foo\n\n  GET a  \nFIND foo\n"))
+    captured = capsys.readouterr()
+    assert captured.out.splitlines() == ["foo", "a"]
+
+def test_run_script_rejects_extra_arguments(store, capsys):
+    run_script(store, io.StringIO("SET a foo bar baz\nGET a\n"))
+    captured = capsys.readouterr()
+    assert captured.out.splitlines() == ["INVALID SET COMMAND", "NULL"]
+
+def test_rollback_after_repeated_writes(store):
+    store.set("a", "foo")
+    store.begin()
+    for i in range(100):
+        store.set("a", str(i))
+        store.unset("a")
+    store.set("b", "foo")
+    store.begin()
+    store.set("a", "bar")
+    store.set("b", "bar")
+    store.commit()
+    store.rollback()
+    assert store.get("a") == "foo"
+    assert store.get("b") == "NULL"
+    assert store.find("foo") == ["a"]
+    assert store.counts("bar") == 0
+
+def test_transaction_log_is_capped(store, capsys, monkeypatch):
+    monkeypatch.setattr(KVStore, "LOG_CAP", 2)
+    store.begin()
+    for value in ("foo", "bar", "baz"):
+        store.set("a", value)
+    store.commit()
+    captured = capsys.readouterr()
+    assert captured.out.strip() == (
+        "COMMIT: Changes applied. Log: ['SET a bar', 'SET a baz'] (2 earlier entries omitted)"
+    )
+
+def test_transaction_log_disabled(store, capsys, monkeypatch):
+    monkeypatch.setattr(KVStore, "LOG_ENABLED", False)
+    store.begin()
+    store.set("a", "foo")
+    store.rollback()
+    captured = capsys.readouterr()
+    assert captured.out.strip() == "ROLLBACK: Changes reverted. Log: []"
+    assert store.get("a") == "NULL"
+
+def test_wal_recovers_committed_state(tmp_path):
+    path = str(tmp_path / "kv.wal")
+    wal = WalWriter(path)
+    store = KVStore(wal)
+    store.set("a", "foo")
+    store.set("b", "foo")
+    store.unset("b")
+    store.begin()
+    store.set("c", "bar")
+    store.begin()
+    store.unset("a")
+    store.commit()
+    store.commit()
+    store.begin()
+    store.set("d", "baz")
+    store.rollback()
+    wal.close()
+
+    restored = KVStore(WalWriter(path))
+    assert restored._data == {"c": "bar"}
+    assert restored.find("bar") == ["c"]
+
+@pytest.mark.parametrize("tail", [
+    '["SET", "b"',  # Оборванная последняя строка
+    '["BEGIN"]\n["SET", "a", "bar"]\n',  # Незавершенная транзакция
+    '5\n',  # Корректный JSON, но не список
+    '[]\n',
+    '["SET"]\n',  # Неверное число элементов
+    '[["SET"], "b"]\n',
+    '["DROP", "b"]\n',  # Неизвестная операция
+])
+def test_wal_recovery_truncates_tail(tmp_path, tail):
+    path = tmp_path / "kv.wal"
+    path.write_text('["SET", "a", "foo"]\n' + tail, encoding="utf-8")
+    wal = WalWriter(str(path))
+    store = KVStore(wal)
+    assert store.get("a") == "foo"
+    assert store.get("b") == "NULL"
+
+    # Записи после восстановления должны пережить следующий перезапуск
+    store.set("c", "bar")
+    store.close()
+    assert path.read_text(encoding="utf-8") == '["SET", "a", "foo"]\n["SET", "c", "bar"]\n'
+
+    restored = KVStore(WalWriter(str(path)))
+    assert restored._data == {"a": "foo", "c": "bar"}
+
+def test_wal_replay_interns_strings(tmp_path):
+    path = tmp_path / "kv.wal"
+    path.write_text('["SET", "key", "value"]\n', encoding="utf-8")
+    store = KVStore(WalWriter(str(path)))
+    stored_key, stored_value = next(iter(store._data.items()))
+    assert stored_key is sys.intern("key")
+    assert stored_value is sys.intern("value")
+
+def test_end_flushes_wal(tmp_path):
+    path = tmp_path / "kv.wal"
+    store = KVStore(WalWriter(str(path)))
+    store.set("a", "foo")
+    with pytest.raises(SystemExit):
+        store.process_command(["END"])
+    assert path.read_text(encoding="utf-8") == '["SET", "a", "foo"]\n'
+
+def test_process_batch(store, capsys):
+    store.process_batch(["SET a foo\n", "\n", "begin\n", "SET b foo\n", "COMMIT\n", "COUNTS foo\n", "NOPE\n"])
+    captured = capsys.readouterr()
+    assert captured.out.splitlines() == [
+        "COMMIT: Changes applied. Log: ['BEGIN', 'SET b foo']",
+        "2",
+        "INVALID COMMAND: NOPE",
+    ]
+
+def test_large_cluster_on_one_value(store):
+    keys = [f"k{i}" for i in range(100_000)]
+    random.Random(0).shuffle(keys)
+    for key in keys:
+        store.set(key, "1")
+    assert store.counts("1") == len(keys)
+    for key in keys[::2]:
+        store.unset(key)
+    assert store.counts("1") == len(keys) // 2
+    assert store.find("1") == sorted(keys[1::2])